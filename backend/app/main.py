@@ -1,146 +1,567 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
-from datetime import datetime
+from datetime import datetime, timezone
+from contextlib import asynccontextmanager, contextmanager
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import uvicorn
 import argparse
-import os
-import sys
-from pathlib import Path
-from agents import Agent, Runner, function_tool, trace
+from urllib.parse import urlparse
+from agents import Agent, ModelSettings, Runner
 from dotenv import load_dotenv
-import requests
-from bs4 import BeautifulSoup
+from openai import AsyncOpenAI
+from openai.types.responses import ResponseTextDeltaEvent
+from prometheus_client import Histogram
+from prometheus_fastapi_instrumentator import Instrumentator
+import httpx
+import numpy as np
+import orjson
+from lxml import etree
 from youtube_transcript_api import YouTubeTranscriptApi
 import re
-import json
+import logging
+import asyncio
+import codecs
+import hashlib
+import os
+import time
 
 load_dotenv(override=True)
 
-@function_tool
-def extract_webpage(url: str) -> str:
+log = logging.getLogger("ingest")
+
+
+def _configure_logging() -> None:
+    """Send ingest logs to stderr at INGEST_LOG_LEVEL (default info).
+
+    Called from the lifespan so the level applies however the app is served:
+    this script, --reload, or the uvicorn CLI.
+    """
+    log.setLevel(os.getenv("INGEST_LOG_LEVEL", "info").upper())
+    if not log.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(levelname)s:     [%(name)s] %(message)s"))
+        log.addHandler(handler)
+        log.propagate = False
+
+# Characters of extracted text kept for the response and the synthesis prompt
+FULL_TEXT_LIMIT = 8000
+# Decoded bytes of HTML read per page before giving up on finding more text
+MAX_PAGE_BYTES = 2_000_000
+
+_YT_ID_RE = re.compile(r'(?:v=|/)([0-9A-Za-z_-]{11})')
+
+
+_SKIPPED_TAGS = {'script', 'style'}
+_HTML_MEDIA_TYPES = {'text/html', 'application/xhtml+xml'}
+
+
+def _page_text(root) -> tuple[str, str]:
+    """Return (title, text) for a parsed HTML tree."""
+    # Remove script and style elements (and comments) but keep their tails
+    etree.strip_elements(root, etree.Comment, *_SKIPPED_TAGS, with_tail=False)
+
+    title = (root.findtext('.//title') or '').strip()
+    text = '\n'.join(s for s in (t.strip() for t in root.itertext()) if s)
+    return title, text
+
+
+def _html_parser(charset: Optional[str]) -> etree.HTMLPullParser:
+    """Build the pull parser, decoding with the header charset if lxml knows it.
+
+    An unknown charset falls back to lxml's own detection (<meta charset>,
+    then Latin-1) instead of failing the extraction.
+    """
+    names = []
+    if charset:
+        try:
+            # lxml knows some codecs only by their raw name, others only canonically
+            names = [charset, codecs.lookup(charset).name]
+        except LookupError:
+            log.debug("Ignoring unknown charset %r", charset)
+    for name in names:
+        try:
+            return etree.HTMLPullParser(events=('end',), encoding=name)
+        except LookupError:
+            continue
+    return etree.HTMLPullParser(events=('end',), encoding=None)
+
+
+def _feed_page_chunk(parser, chunk: bytes) -> int:
+    """Feed one chunk of HTML and return the length of text it completed."""
+    parser.feed(chunk)
+    text_len = 0
+    for _, element in parser.read_events():
+        if element.tag not in _SKIPPED_TAGS:
+            text_len += len((element.text or '').strip())
+        # Child tails are complete once their parent has ended
+        text_len += sum(len((child.tail or '').strip()) for child in element)
+    return text_len
+
+
+async def extract_webpage(url: str) -> dict:
     """Extract text content from a webpage URL.
 
     Args:
         url: The URL of the webpage to extract content from
 
     Returns:
-        JSON string with extracted content including title and text
+        Dict with extracted content including title and text
     """
+    # lxml work happens on one worker thread so a large page never blocks the
+    # loop, and the parser is only ever touched from that thread
+    parse_thread = ThreadPoolExecutor(max_workers=1)
+    loop = asyncio.get_running_loop()
     try:
-        response = requests.get(url, timeout=10, headers={'User-Agent': 'Mozilla/5.0'})
-        soup = BeautifulSoup(response.content, 'html.parser')
+        # Parse as the body arrives and stop once enough text has been seen,
+        # so large pages are neither fully downloaded nor fully built in memory
+        text_len = 0
+        bytes_read = 0
+        async with app.state.http_client.stream('GET', url, timeout=10) as response:
+            content_type = response.headers.get('content-type', '')
+            # Media types are case-insensitive (RFC 9110)
+            if content_type.split(';')[0].strip().lower() not in _HTML_MEDIA_TYPES:
+                return {'success': False, 'error': f"unsupported content type: {content_type or 'unknown'}"}
+
+            # Use the header charset when there is one; lxml otherwise only
+            # looks at <meta charset> and falls back to Latin-1
+            parser = await loop.run_in_executor(parse_thread, _html_parser, response.charset_encoding)
+
+            async for chunk in response.aiter_bytes():
+                text_len += await loop.run_in_executor(parse_thread, _feed_page_chunk, parser, chunk)
+                bytes_read += len(chunk)
+                if text_len >= FULL_TEXT_LIMIT or bytes_read >= MAX_PAGE_BYTES:
+                    # Leaving the block closes the response mid-body
+                    break
+        title, text = await loop.run_in_executor(parse_thread, lambda: _page_text(parser.close()))
+        title = title or url
+        text = text[:FULL_TEXT_LIMIT]
 
-        # Remove script and style elements
-        for script in soup(["script", "style"]):
-            script.decompose()
-
-        title = soup.title.string if soup.title else url
-        text = soup.get_text(separator='\n', strip=True)
-
-        return json.dumps({
+        return {
             'success': True,
             'url': url,
             'title': title,
-            'text_preview': text[:2000],
-            'full_text': text[:8000]  # Limit to 8k chars
-        })
+            'full_text': text
+        }
     except Exception as e:
-        return json.dumps({'success': False, 'error': str(e)})
+        log.warning("Webpage extraction failed for %s: %s", url, e)
+        return {'success': False, 'error': str(e)}
+    finally:
+        parse_thread.shutdown(wait=False)
 
 
-@function_tool
-def extract_youtube(url: str) -> str:
+async def extract_youtube(url: str) -> dict:
     """Extract transcript from a YouTube video URL.
 
     Args:
         url: The YouTube video URL
 
     Returns:
-        JSON string with extracted transcript
+        Dict with extracted transcript
     """
     try:
-        print(f"[EXTRACT_YOUTUBE] Processing URL: {url}")
+        log.debug("Extracting YouTube transcript: %s", url)
 
         # Extract video ID
-        video_id_match = re.search(r'(?:v=|/)([0-9A-Za-z_-]{11}).*', url)
+        video_id_match = _YT_ID_RE.search(url)
         if not video_id_match:
             error_msg = 'Invalid YouTube URL format'
-            print(f"[EXTRACT_YOUTUBE] ERROR: {error_msg}")
-            return json.dumps({'success': False, 'error': error_msg})
+            log.warning("YouTube extraction failed for %s: %s", url, error_msg)
+            return {'success': False, 'error': error_msg}
 
         video_id = video_id_match.group(1)
-        print(f"[EXTRACT_YOUTUBE] Extracted video ID: {video_id}")
+        log.debug("Extracted video ID: %s", video_id)
 
         # Try to get transcript using the new API
-        ytt_api = YouTubeTranscriptApi()
-        transcript = ytt_api.fetch(video_id, languages=['en'])
-        print(f"[EXTRACT_YOUTUBE] Successfully retrieved transcript")
+        transcript = await asyncio.to_thread(app.state.ytt_api.fetch, video_id, languages=['en'])
+        log.debug("Retrieved transcript for %s", video_id)
 
         # Combine transcript text - use .text attribute instead of dictionary access
         full_text = ' '.join([snippet.text for snippet in transcript])
         title = f"YouTube Video: {video_id}"
 
-        print(f"[EXTRACT_YOUTUBE] Full text length: {len(full_text)} characters")
+        log.debug("Transcript length: %d characters", len(full_text))
+        full_text = full_text[:FULL_TEXT_LIMIT]
 
-        return json.dumps({
+        return {
             'success': True,
             'url': url,
             'video_id': video_id,
             'title': title,
-            'text_preview': full_text[:2000],
-            'full_text': full_text[:8000]
-        })
+            'full_text': full_text
+        }
     except Exception as e:
         error_msg = f"{type(e).__name__}: {str(e)}"
-        print(f"[EXTRACT_YOUTUBE] ERROR: {error_msg}")
-        return json.dumps({'success': False, 'error': error_msg})
+        log.warning("YouTube extraction failed for %s: %s", url, error_msg)
+        return {'success': False, 'error': error_msg}
+
+
+_YOUTUBE_HOSTS = ('youtube.com', 'youtu.be')
+
+
+def _host_matches(host: str, domains: tuple) -> bool:
+    """True if host is one of domains or a subdomain of one."""
+    return host in domains or host.endswith(tuple('.' + d for d in domains))
+
+
+async def extract_content(url: str) -> dict:
+    """Route a URL to the matching extractor; no LLM is needed to decide."""
+    parsed = urlparse(url)
+    if parsed.scheme not in ('http', 'https'):
+        return {'success': False, 'error': f"unsupported URL scheme: {parsed.scheme or 'none'}"}
+
+    host = (parsed.hostname or '').lower()
+    if _host_matches(host, _YOUTUBE_HOSTS):
+        return await extract_youtube(url)
+    return await extract_webpage(url)
+
 
 # ============================================================================
 # 5. Define Agents
 # ============================================================================
 
-# Content Extraction Agent
-extractor_agent = Agent(
-    name="Content Extractor",
-    instructions="""You MUST extract content from web pages and YouTube videos using the provided tools.
+class Analysis(BaseModel):
+    key_points: list[str]
+    concepts: list[str]
+    summary: str
 
-    For EVERY URL you receive:
-    1. Check if the URL contains 'youtube.com' or 'youtu.be' - if YES, use extract_youtube tool
-    2. For all other URLs - use extract_webpage tool
-    3. ALWAYS call the appropriate tool - do not respond without calling a tool
-    4. Return the exact JSON result from the tool
 
-    You must call one of the extraction tools for every request.
-    """,
-    tools=[extract_webpage, extract_youtube],
-    model="gpt-4o-mini"
-)
-
-# Synthesis Agent
-synthesis_agent = Agent(
-    name="Content Analyzer",
-    instructions="""You analyze learning content and extract key insights.
+# Synthesis prompt. Everything here is static so it forms a stable prefix
+# (over 1024 tokens) that OpenAI's prompt cache can reuse across requests;
+# per-request content only ever goes in the user input, after this.
+SYNTHESIS_INSTRUCTIONS = """You analyze learning content and extract key insights.
     For each piece of content:
     1. Read the content text from the extraction result
     2. Extract 5-10 key points (important takeaways)
     3. Identify main concepts (technical terms, frameworks, ideas)
     4. Write a concise 2-3 sentence summary
     5. Return the analysis in a structured format
+
+    Output format
+    Return a single object with exactly these fields:
+    - key_points: list of 5-10 strings. Each point is one self-contained
+      sentence a reader could review later without the source. Lead with the
+      idea, not with "The article says". Order points as they build on each
+      other in the source, not by how often they are repeated.
+    - concepts: list of 3-12 short strings naming the technical terms,
+      frameworks, tools, people or ideas the content relies on. Use the
+      canonical name ("gradient descent", not "the descent method"), singular
+      form, and no trailing punctuation. Do not repeat a concept with
+      different casing or spelling.
+    - summary: 2-3 sentences in plain prose saying what the content is about
+      and why it matters to someone learning the topic.
+
+    Guidelines
+    - Work only from the provided text. Do not add facts, numbers or claims
+      that are not in it, even if you know them to be true.
+    - The text was scraped from a web page or a video transcript, so it may
+      include navigation labels, cookie banners, footers, ads, timestamps or
+      speaker filler ("um", "you know"). Ignore all of that.
+    - Transcripts have no punctuation or headings; infer structure from the
+      flow of ideas rather than from formatting.
+    - The text may be cut off at a length limit. Summarize what is present and
+      do not speculate about the missing part.
+    - If the content is a list, tutorial or reference page, key points should
+      capture the steps or rules a learner needs, not describe the page.
+    - If the content is opinion or argument, state the claims as the author's
+      position ("The author argues ...") rather than as settled fact.
+    - If the text is empty, an error message, a login wall or otherwise has no
+      learning content, return an empty key_points list, an empty concepts
+      list, and a summary of one sentence explaining that no content could be
+      analyzed.
+    - Write in English regardless of the source language, keeping proper
+      nouns and code identifiers as they appear.
+    - Keep code identifiers, commands and formulas verbatim.
+
+    Example 1
+    Content: an article explaining how Python's asyncio event loop schedules
+    coroutines and why blocking calls stall every other task.
+    Output:
+    key_points:
+    - asyncio runs all coroutines on a single thread driven by an event loop.
+    - A coroutine only yields control to the loop at an await point.
+    - Any blocking call inside a coroutine stalls every other task on the loop.
+    - CPU-bound or blocking library calls should be moved to a thread or
+      process pool with asyncio.to_thread or run_in_executor.
+    - I/O-bound work benefits from async because many waits can overlap.
+    concepts: ["asyncio", "event loop", "coroutine", "await",
+    "asyncio.to_thread", "thread pool"]
+    summary: The article explains how asyncio's single-threaded event loop
+    interleaves coroutines at await points. It shows why blocking calls hurt
+    every concurrent task and how to offload them to worker threads.
+
+    Example 2
+    Content: a transcript of a lecture introducing gradient descent for
+    training a linear regression model.
+    Output:
+    key_points:
+    - Linear regression fits a line by minimizing the mean squared error
+      between predictions and targets.
+    - Gradient descent repeatedly moves the parameters a small step against the
+      gradient of the loss.
+    - The learning rate controls the step size; too large diverges, too small
+      converges slowly.
+    - Features on very different scales slow convergence, so inputs are
+      usually normalized first.
+    - Training stops when the loss stops improving or after a fixed number of
+      epochs.
+    concepts: ["linear regression", "mean squared error", "gradient descent",
+    "learning rate", "feature scaling", "epoch"]
+    summary: The lecture introduces gradient descent as the optimization method
+    behind linear regression. It covers how the learning rate and feature
+    scaling affect convergence and when to stop training.
+
+    Example 3
+    Content: "Please enable JavaScript and cookies to continue."
+    Output:
+    key_points: []
+    concepts: []
+    summary: The page returned no readable content to analyze.
+    """
+
+
+# Synthesis Agent
+synthesis_agent = Agent(
+    name="Content Analyzer",
+    instructions=SYNTHESIS_INSTRUCTIONS,
+    tools=[],
+    output_type=Analysis,
+    model="gpt-4o-mini",
+    # Keeps requests sharing the prefix on the same cache shard
+    model_settings=ModelSettings(extra_body={"prompt_cache_key": "synth-v1"}),
+)
+
+# Larger model, reserved for content the small one summarizes poorly
+synthesis_agent_large = synthesis_agent.clone(model="gpt-4o")
+
+# Hosts whose pages are dense enough (papers, preprints) to need the large model
+_ACADEMIC_HOSTS = ('arxiv.org', 'doi.org', 'acm.org', 'ieee.org', 'openreview.net', 'semanticscholar.org')
+
+
+def pick_synthesis_agent(url: str, extraction: dict) -> Agent:
+    """Choose the synthesis model from a cheap URL heuristic.
+
+    Academic sources go to the larger model; everything else, videos
+    included, goes to gpt-4o-mini. Length is not a signal: every extractor
+    cuts its text to FULL_TEXT_LIMIT, so a long transcript gives the large
+    model no more to work with than a blog post.
+    """
+    host = (urlparse(url).hostname or '').lower()
+    if host.endswith('.edu') or _host_matches(host, _ACADEMIC_HOSTS):
+        return synthesis_agent_large
+    return synthesis_agent
+
+
+class DuplicateVerdict(BaseModel):
+    same_content: bool
+
+
+# Duplicate Checker Agent (second stage of the semantic cache)
+duplicate_checker_agent = Agent(
+    name="Duplicate Checker",
+    instructions="""You decide whether two text excerpts come from the same piece of content.
+    The excerpts were scraped from web pages or video transcripts and may differ in
+    navigation text, ads, formatting or where they were cut off.
+    Pages from the same site often share menus, cookie banners and footers; that shared
+    text does not make them the same. Compare the titles and the main body.
+    Answer same_content=true only if both are the same article, post, page or video
+    (including reposts, AMP/canonical variants or mirrors). Different pages on a similar
+    topic, or different parts of a series, are not the same content.
     """,
     tools=[],
+    output_type=DuplicateVerdict,
     model="gpt-4o-mini"
 )
 
+# ============================================================================
+# 6. Response Cache
+# ============================================================================
+
+CACHE_TTL_SECONDS = 3600
+CACHE_MAX_ENTRIES = 1024
+
+# sha256(url) -> (extraction, analysis, stored_at)
+_ingest_cache: dict[str, tuple[dict, dict, float]] = {}
+# sha256(url) -> future of the run in flight, so duplicate requests share one
+# pipeline run whether it succeeds, fails or raises
+_ingest_inflight: dict[str, asyncio.Future] = {}
+
+
+def _cache_key(url: str) -> str:
+    return hashlib.sha256(url.encode()).hexdigest()
+
+
+def _cache_get(key: str) -> Optional[tuple[dict, dict, float]]:
+    entry = _ingest_cache.get(key)
+    if entry is None:
+        return None
+    if time.monotonic() - entry[2] > CACHE_TTL_SECONDS:
+        del _ingest_cache[key]
+        return None
+    return entry
+
+
+def _cache_put(key: str, extraction: dict, analysis: dict) -> None:
+    _ingest_cache.pop(key, None)
+    if len(_ingest_cache) >= CACHE_MAX_ENTRIES:
+        # Dicts keep insertion order, so the first key is the oldest entry
+        del _ingest_cache[next(iter(_ingest_cache))]
+    _ingest_cache[key] = (extraction, analysis, time.monotonic())
+
+
+# ============================================================================
+# 7. Synthesis
+# ============================================================================
+
+SYNTHESIS_MAX_CONCURRENCY = 10
+
+SYNTHESIS_SECONDS = Histogram(
+    "ingest_synthesis_seconds",
+    "Wall time of synthesis agent runs",
+    ["model"],
+)
+
+# Caps agent runs in flight across all requests so bursts of ingests share
+# the SDK's pooled OpenAI connections instead of fanning out without limit
+_synthesis_slots = asyncio.Semaphore(SYNTHESIS_MAX_CONCURRENCY)
+
+
+def _synthesis_input(content_text: str) -> str:
+    # Variable content goes last so the cached prompt prefix stays intact
+    return f"Analyze this content and provide key points, concepts, and summary:\n\n{content_text}"
+
+
+async def _run_synthesis(agent: Agent, content_text: str) -> dict:
+    """Run a synthesis agent over content and return its analysis."""
+    async with _synthesis_slots:
+        with SYNTHESIS_SECONDS.labels(agent.model).time():
+            result = await Runner.run(
+                starting_agent=agent,
+                input=_synthesis_input(content_text)
+            )
+    return result.final_output.model_dump()
+
+
+# ============================================================================
+# 8. Semantic Cache
+# ============================================================================
+
+SEMANTIC_EMBEDDING_MODEL = "text-embedding-3-small"
+SEMANTIC_EMBEDDING_DIMS = 1536
+SEMANTIC_HIT_THRESHOLD = 0.92  # reuse outright, if the titles also match
+SEMANTIC_VERIFY_THRESHOLD = 0.85  # otherwise ask duplicate_checker_agent first
+SEMANTIC_MAX_ENTRIES = 1024
+
+# Ring buffer: row i holds the unit embedding for _semantic_entries[i],
+# which is (title, full_text, analysis)
+_semantic_vectors = np.zeros((SEMANTIC_MAX_ENTRIES, SEMANTIC_EMBEDDING_DIMS), dtype=np.float32)
+_semantic_entries: list[Optional[tuple[str, str, dict]]] = [None] * SEMANTIC_MAX_ENTRIES
+_semantic_count = 0
+_semantic_next = 0
+
+
+async def _embed(text: str) -> np.ndarray:
+    response = await app.state.openai_client.embeddings.create(
+        model=SEMANTIC_EMBEDDING_MODEL,
+        input=text,
+    )
+    vector = np.asarray(response.data[0].embedding, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+async def _semantic_get(title: str, text: str, vector: np.ndarray) -> Optional[dict]:
+    """Return the analysis of a previously seen near-duplicate, if any.
+
+    Pages from one site share navigation and banner text, so similarity alone
+    is not proof of a duplicate. A match is reused directly only when it is
+    at or above SEMANTIC_HIT_THRESHOLD and has the same title; any other
+    match at or above SEMANTIC_VERIFY_THRESHOLD is confirmed by
+    duplicate_checker_agent.
+    """
+    if not _semantic_count:
+        return None
+    scores = _semantic_vectors[:_semantic_count] @ vector
+    best = int(np.argmax(scores))
+    score = float(scores[best])
+    # Read the entry now; the slot may be reused while we await the checker
+    cached_title, cached_text, analysis = _semantic_entries[best]
+
+    if score >= SEMANTIC_HIT_THRESHOLD and cached_title == title:
+        return analysis
+    if score >= SEMANTIC_VERIFY_THRESHOLD:
+        result = await Runner.run(
+            starting_agent=duplicate_checker_agent,
+            input=(
+                f"Excerpt A (title: {cached_title}):\n{cached_text}\n\n"
+                f"Excerpt B (title: {title}):\n{text}"
+            )
+        )
+        if result.final_output.same_content:
+            return analysis
+    return None
+
+
+def _semantic_put(title: str, text: str, vector: np.ndarray, analysis: dict) -> None:
+    global _semantic_count, _semantic_next
+    _semantic_vectors[_semantic_next] = vector
+    _semantic_entries[_semantic_next] = (title, text, analysis)
+    _semantic_next = (_semantic_next + 1) % SEMANTIC_MAX_ENTRIES
+    _semantic_count = min(_semantic_count + 1, SEMANTIC_MAX_ENTRIES)
+
+
 class Visit(BaseModel):
     url: str
     tab_id: Optional[int] = None
     timestamp: Optional[str] = None
     source: Optional[str] = "extension"
+    # Skip the URL and semantic caches and run the full pipeline (benchmarks)
+    bypass_cache: bool = False
 
 
-app = FastAPI(title="URL Ingestion Service", version="0.1.0")
+class IngestResponse(BaseModel):
+    """Body of /ingest. Failed runs carry error instead of the results."""
+    accepted: bool
+    url: str
+    tab_id: Optional[int] = None
+    timestamp: Optional[str] = None
+    cached: Optional[bool] = None
+    extraction: Optional[dict] = None
+    analysis: Optional[Analysis] = None
+    error: Optional[str] = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    _configure_logging()
+
+    # Sized for blocking YouTube transcript fetches
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=32))
+
+    # One pooled client per process so concurrent ingests share connections
+    app.state.http_client = httpx.AsyncClient(
+        http2=True,
+        follow_redirects=True,
+        headers={'User-Agent': 'Mozilla/5.0', 'Accept-Encoding': 'gzip, br'},
+        limits=httpx.Limits(max_keepalive_connections=100, max_connections=200),
+    )
+    # Shared so its requests.Session keeps YouTube connections alive
+    app.state.ytt_api = YouTubeTranscriptApi()
+    app.state.openai_client = AsyncOpenAI()
+    try:
+        yield
+    finally:
+        await app.state.http_client.aclose()
+        await app.state.openai_client.close()
+
+
+app = FastAPI(
+    title="URL Ingestion Service",
+    version="0.1.0",
+    lifespan=lifespan,
+)
 
 
 # CORS: keep permissive for development; tighten as needed
@@ -152,69 +573,260 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request count/latency histograms at /metrics
+Instrumentator().instrument(app).expose(app)
+
 
 @app.get("/")
-def healthcheck():
+def healthcheck() -> dict[str, str]:
     return {"status": "ok", "service": "url-ingestion"}
 
 
-@app.post("/ingest")
-async def ingest_url(visit: Visit):
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+
+
+async def _extract_and_match(url: str, use_cache: bool = True) -> tuple[dict, Optional[dict], Optional[tuple[str, str, np.ndarray]]]:
+    """Extract a URL's content and look for a near-duplicate earlier ingest.
+
+    Returns (extraction, analysis, semantic_key). analysis is set on a
+    semantic cache hit; otherwise semantic_key, when not None, is the
+    (title, text, vector) triple to store the fresh analysis under. With
+    use_cache=False the semantic cache is neither read nor written.
+    """
+    log.debug("Extracting content: %s", url)
+    extraction_data = await extract_content(url)
+    log.debug("Extraction result: %s", extraction_data)
+
+    # Near-duplicate pages (tracking params, AMP, mirrors) reuse an earlier analysis.
+    # The whole text is embedded: the start of a page is mostly site chrome.
+    title = extraction_data.get('title', '')
+    text = extraction_data.get('full_text', '')
+    if not use_cache or not extraction_data.get('success') or not text:
+        return extraction_data, None, None
+    try:
+        vector = await _embed(text)
+        analysis = await _semantic_get(title, text, vector)
+    except Exception as e:
+        log.warning("Semantic cache unavailable: %s", e)
+        return extraction_data, None, None
+    if analysis is not None:
+        log.debug("Semantic cache hit, skipping synthesis: %s", url)
+    return extraction_data, analysis, (title, text, vector)
+
+
+async def _run_pipeline(url: str, use_cache: bool = True) -> tuple[dict, Optional[dict], bool]:
+    """Extract a URL's content and run the synthesis agent over it.
+
+    Returns (extraction, analysis, cached), where cached means the analysis
+    came from a semantically matching earlier ingest. analysis is None when
+    extraction failed, since there is nothing to summarize.
+    """
+    extraction_data, analysis, semantic_key = await _extract_and_match(url, use_cache)
+    if not extraction_data.get('success'):
+        return extraction_data, None, False
+    if analysis is not None:
+        return extraction_data, analysis, True
+
+    # Run synthesis agent to analyze and summarize
+    agent = pick_synthesis_agent(url, extraction_data)
+    log.debug("Starting synthesis agent (%s): %s", agent.model, url)
+    analysis = await _run_synthesis(agent, extraction_data.get('full_text', ''))
+    log.debug("Synthesis result: %s", analysis)
+
+    if semantic_key is not None:
+        _semantic_put(*semantic_key, analysis)
+    return extraction_data, analysis, False
+
+
+async def _join_or_claim(key: str) -> tuple[Optional[tuple[dict, Optional[dict], bool]], Optional[asyncio.Future]]:
+    """Serve a URL from the cache or from a run already in flight for it.
+
+    Returns (result, claim). result is the (extraction, analysis, cached)
+    tuple when another request produced it; otherwise claim is a new future
+    registered for key, and the caller must run the pipeline inside
+    _owning_run(key, claim) and set its result.
+    """
+    while True:
+        entry = _cache_get(key)
+        if entry is not None:
+            return (entry[0], entry[1], True), None
+
+        inflight = _ingest_inflight.get(key)
+        if inflight is None:
+            claim = asyncio.get_running_loop().create_future()
+            _ingest_inflight[key] = claim
+            return None, claim
+
+        try:
+            # Shielded so one waiter going away doesn't cancel the run for all
+            return await asyncio.shield(inflight), None
+        except asyncio.CancelledError:
+            if not inflight.cancelled():
+                raise
+            # Its owner went away before finishing; try again
+
+
+@contextmanager
+def _owning_run(key: str, claim: asyncio.Future):
+    """Hand the outcome of the enclosed run to every request waiting on claim.
+
+    An exception is passed on to the waiters. If the owner leaves without a
+    result (a dropped stream), claim is cancelled and the waiters retry.
+    """
+    try:
+        yield
+    except Exception as e:
+        if not claim.done():
+            claim.set_exception(e)
+            # Waiters re-raise it; don't also log it as never retrieved
+            claim.exception()
+        raise
+    finally:
+        if not claim.done():
+            claim.cancel()
+        if _ingest_inflight.get(key) is claim:
+            del _ingest_inflight[key]
+
+
+async def _run_pipeline_cached(url: str, use_cache: bool = True) -> tuple[dict, Optional[dict], bool]:
+    """Return (extraction, analysis, cached), running the pipeline on a miss.
+
+    With use_cache=False the request always runs its own pipeline and
+    touches none of the caches.
+    """
+    if not use_cache:
+        return await _run_pipeline(url, use_cache=False)
+
+    key = _cache_key(url)
+    result, claim = await _join_or_claim(key)
+    if result is not None:
+        return result
+
+    with _owning_run(key, claim):
+        result = await _run_pipeline(url)
+        extraction, analysis, _ = result
+        # Failed extractions are not worth caching
+        if extraction.get('success'):
+            _cache_put(key, extraction, analysis)
+        claim.set_result(result)
+    return result
+
+
+# Unset fields are left out, so error bodies keep their shorter shape
+@app.post("/ingest", response_model_exclude_unset=True)
+async def ingest_url(visit: Visit) -> IngestResponse:
     # Attach server-side timestamp if not provided
     if not visit.timestamp:
-        visit.timestamp = datetime.utcnow().isoformat() + "Z"
+        visit.timestamp = _now_iso()
 
-    print(f"\n{'='*60}")
-    print(f"[INGEST] Processing URL: {visit.url}")
-    print(f"[INGEST] Tab ID: {visit.tab_id}, Timestamp: {visit.timestamp}")
+    log.debug("Processing URL: %s (tab %s, %s)", visit.url, visit.tab_id, visit.timestamp)
 
-    # Process with extractor agent
     try:
-        print(f"[INGEST] Starting extractor agent...")
-        extraction_result = await Runner.run(
-            starting_agent=extractor_agent,
-            input=f"Extract content from this URL: {visit.url}"
+        extraction, analysis, cached = await _run_pipeline_cached(visit.url, not visit.bypass_cache)
+        if cached:
+            log.debug("Cache hit, skipping agents: %s", visit.url)
+
+        return IngestResponse(
+            accepted=True,
+            url=visit.url,
+            tab_id=visit.tab_id,
+            timestamp=visit.timestamp,
+            cached=cached,
+            extraction=extraction,
+            analysis=analysis,
+        )
+    except Exception as e:
+        log.exception("Processing failed for %s", visit.url)
+        return IngestResponse(
+            accepted=True,
+            url=visit.url,
+            tab_id=visit.tab_id,
+            timestamp=visit.timestamp,
+            error=f"processing_error: {str(e)}",
         )
 
-        print(f"[INGEST] Extraction completed successfully")
-        print(f"[INGEST] Extraction Result: {extraction_result.final_output}")
 
-        # Parse the extraction result to get the content
-        try:
-            extraction_data = json.loads(extraction_result.final_output)
-            content_text = extraction_data.get('full_text', extraction_data.get('text_preview', ''))
-        except:
-            content_text = str(extraction_result.final_output)
-
-        # Run synthesis agent to analyze and summarize
-        print(f"[INGEST] Starting synthesis agent...")
-        synthesis_result = await Runner.run(
-            starting_agent=synthesis_agent,
-            input=f"Analyze this content and provide key points, concepts, and summary:\n\n{content_text}"
-        )
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {orjson.dumps(data).decode()}\n\n"
 
-        print(f"[INGEST] Synthesis completed successfully")
-        print(f"[INGEST] Summary: {synthesis_result.final_output}")
-        print(f"{'='*60}\n")
 
-        return {
-            "accepted": True,
-            "url": visit.url,
-            "tab_id": visit.tab_id,
-            "timestamp": visit.timestamp,
-            "extraction": extraction_result.final_output,
-            "analysis": synthesis_result.final_output
-        }
+async def _stream_ingest(visit: Visit):
+    """Yield SSE events: extraction, analysis_delta*, analysis, then done."""
+    envelope = {
+        "accepted": True,
+        "url": visit.url,
+        "tab_id": visit.tab_id,
+        "timestamp": visit.timestamp,
+    }
+    try:
+        key = _cache_key(visit.url)
+        use_cache = not visit.bypass_cache
+        if use_cache:
+            shared, claim = await _join_or_claim(key)
+        else:
+            # A private claim: nothing else can join this run
+            shared, claim = None, asyncio.get_running_loop().create_future()
+        if shared is not None:
+            extraction_data, analysis, cached = shared
+            log.debug("Served from a cached or in-flight run: %s", visit.url)
+            yield _sse("extraction", extraction_data)
+            if analysis is not None:
+                yield _sse("analysis", analysis)
+            yield _sse("done", {**envelope, "cached": cached})
+            return
+
+        with _owning_run(key, claim):
+            extraction_data, analysis, semantic_key = await _extract_and_match(visit.url, use_cache)
+            yield _sse("extraction", extraction_data)
+            if not extraction_data.get('success'):
+                # Nothing to summarize; don't spend a synthesis run on empty text
+                claim.set_result((extraction_data, None, False))
+                yield _sse("done", {**envelope, "cached": False})
+                return
+
+            cached = analysis is not None
+            if not cached:
+                agent = pick_synthesis_agent(visit.url, extraction_data)
+                log.debug("Starting streamed synthesis agent (%s): %s", agent.model, visit.url)
+                # Tokens go straight to the client; the run still takes a concurrency slot
+                async with _synthesis_slots:
+                    with SYNTHESIS_SECONDS.labels(agent.model).time():
+                        result = Runner.run_streamed(
+                            starting_agent=agent,
+                            input=_synthesis_input(extraction_data.get('full_text', ''))
+                        )
+                        try:
+                            async for event in result.stream_events():
+                                if event.type == "raw_response_event" and isinstance(event.data, ResponseTextDeltaEvent):
+                                    yield _sse("analysis_delta", {"delta": event.data.delta})
+                        finally:
+                            # A client that disconnects mid-stream must not leave the run going
+                            if not result.is_complete:
+                                result.cancel()
+                analysis = result.final_output.model_dump()
+                log.debug("Synthesis result: %s", analysis)
+                if semantic_key is not None:
+                    _semantic_put(*semantic_key, analysis)
+
+            if use_cache:
+                _cache_put(key, extraction_data, analysis)
+            claim.set_result((extraction_data, analysis, cached))
+        yield _sse("analysis", analysis)
+        yield _sse("done", {**envelope, "cached": cached})
     except Exception as e:
-        print(f"[INGEST] ERROR: {str(e)}")
-        print(f"{'='*60}\n")
-        return {
-            "accepted": True,
-            "url": visit.url,
-            "tab_id": visit.tab_id,
-            "timestamp": visit.timestamp,
-            "error": f"processing_error: {str(e)}"
-        }
+        log.exception("Processing failed for %s", visit.url)
+        yield _sse("error", {**envelope, "error": f"processing_error: {str(e)}"})
+
+
+@app.post("/ingest/stream")
+async def ingest_url_stream(visit: Visit):
+    """Same pipeline as /ingest, streamed as Server-Sent Events."""
+    if not visit.timestamp:
+        visit.timestamp = _now_iso()
+
+    log.debug("Streaming URL: %s (tab %s, %s)", visit.url, visit.tab_id, visit.timestamp)
+    return StreamingResponse(_stream_ingest(visit), media_type="text/event-stream")
 
 @app.get("/records")
 def list_records(limit: int = 20):
@@ -227,9 +839,12 @@ def list_records(limit: int = 20):
         return {"error": "agents storage not available"}
     try:
         storage = JSONLStorage(agent_settings.storage_path)
-        items = list(storage.read_all())
+        records = storage.read_all()
         if limit and limit > 0:
-            items = items[-limit:]
+            # Only the last `limit` records are held while scanning the file
+            items = deque(records, maxlen=limit)
+        else:
+            items = list(records)
         # Return newest first
         return [rec.model_dump(mode="json") for rec in reversed(items)]
     except Exception as e:
@@ -240,8 +855,18 @@ if __name__ == "__main__":
     parser.add_argument("--host", default="0.0.0.0")
     parser.add_argument("--port", type=int, default=8000)
     parser.add_argument("--reload", action="store_true", help="Enable auto-reload (requires import string)")
+    parser.add_argument(
+        "--log-level",
+        default=os.getenv("INGEST_LOG_LEVEL", "info"),
+        help="Log level for the ingest pipeline and uvicorn (e.g. debug)",
+    )
     args = parser.parse_args()
 
+    # The lifespan reads this, including in the worker process --reload spawns
+    os.environ["INGEST_LOG_LEVEL"] = args.log_level
+    _configure_logging()
+    log_level = args.log_level.lower()
+
     if args.reload:
         # Reload requires an import string; run from repo root for this to work
         try:
@@ -250,9 +875,10 @@ if __name__ == "__main__":
                 host=args.host,
                 port=args.port,
                 reload=True,
+                log_level=log_level,
             )
         except Exception as e:
-            print("[url-ingestion] Reload failed; starting without reload. Reason:", e)
-            uvicorn.run(app, host=args.host, port=args.port, reload=False)
+            log.warning("Reload failed; starting without reload. Reason: %s", e)
+            uvicorn.run(app, host=args.host, port=args.port, reload=False, log_level=log_level)
     else:
-        uvicorn.run(app, host=args.host, port=args.port, reload=False)
+        uvicorn.run(app, host=args.host, port=args.port, reload=False, log_level=log_level)
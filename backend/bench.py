@@ -0,0 +1,115 @@
+"""Latency baseline for the ingestion service.
+
+Posts a fixed set of URLs to a running /ingest endpoint and reports
+p50/p95/p99 wall time, split into cached and uncached responses so cache
+hits don't hide regressions in the agent path.
+
+By default every request sets bypass_cache, so each one runs the full
+pipeline and all samples are uncached. With --cached the server's caches
+answer repeats instead; the iterations of one URL then run one after
+another, so each repeat is a real cache hit rather than a duplicate
+waiting on the first run.
+
+    python backend/bench.py --url https://example.com -n 5 --concurrency 4
+    python backend/bench.py --url https://example.com -n 5 --cached
+
+Server-side histograms (request latency, synthesis time per model) are
+exposed by the service itself at /metrics.
+"""
+import argparse
+import asyncio
+import math
+import time
+
+import httpx
+
+DEFAULT_URLS = [
+    "https://example.com",
+    "https://en.wikipedia.org/wiki/Event_loop",
+    "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+]
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    """Nearest-rank percentile of samples (pct in 0-100)."""
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def report(label: str, samples: list[float]) -> None:
+    if not samples:
+        print(f"{label:<9} n=0")
+        return
+    print(
+        f"{label:<9} n={len(samples):<4} "
+        f"p50={percentile(samples, 50) * 1000:8.1f}ms "
+        f"p95={percentile(samples, 95) * 1000:8.1f}ms "
+        f"p99={percentile(samples, 99) * 1000:8.1f}ms"
+    )
+
+
+async def run(endpoint: str, urls: list[str], iterations: int, concurrency: int, timeout: float, use_cache: bool = False) -> None:
+    limit = asyncio.Semaphore(concurrency)
+    timings = {"cached": [], "uncached": []}
+    errors = 0
+
+    async with httpx.AsyncClient(timeout=timeout) as client:
+        async def ingest(url: str) -> None:
+            nonlocal errors
+            async with limit:
+                start = time.perf_counter()
+                try:
+                    response = await client.post(
+                        endpoint, json={"url": url, "source": "bench", "bypass_cache": not use_cache}
+                    )
+                    body = response.json()
+                except Exception as e:
+                    errors += 1
+                    print(f"[bench] {url}: {type(e).__name__}: {e}")
+                    return
+                elapsed = time.perf_counter() - start
+            if response.status_code != 200 or "error" in body:
+                errors += 1
+                print(f"[bench] {url}: {body.get('error', response.status_code)}")
+                return
+            if not body["extraction"]["success"]:
+                # Failed extractions skip synthesis and would flatter the timings
+                errors += 1
+                print(f"[bench] {url}: extraction failed: {body['extraction'].get('error')}")
+                return
+            timings["cached" if body.get("cached") else "uncached"].append(elapsed)
+
+        async def repeat(url: str) -> None:
+            for _ in range(iterations):
+                await ingest(url)
+
+        if use_cache:
+            await asyncio.gather(*(repeat(url) for url in urls))
+        else:
+            await asyncio.gather(*(ingest(url) for _ in range(iterations) for url in urls))
+
+    report("uncached", timings["uncached"])
+    report("cached", timings["cached"])
+    report("all", timings["uncached"] + timings["cached"])
+    print(f"errors    {errors}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the URL Ingestion /ingest endpoint")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--url", action="append", dest="urls", help="URL to ingest (repeatable; defaults to a built-in set)")
+    parser.add_argument("-n", "--iterations", type=int, default=3, help="Times each URL is posted")
+    parser.add_argument("--concurrency", type=int, default=4, help="Requests in flight at once")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument("--cached", action="store_true", help="Let the server's caches answer repeated URLs")
+    args = parser.parse_args()
+
+    asyncio.run(run(
+        f"{args.base_url.rstrip('/')}/ingest",
+        args.urls or DEFAULT_URLS,
+        args.iterations,
+        args.concurrency,
+        args.timeout,
+        args.cached,
+    ))
@@ -0,0 +1,7 @@
+import os
+import sys
+from pathlib import Path
+
+# main.py is run as a script, not installed as a package
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
@@ -0,0 +1,293 @@
+import asyncio
+
+import httpx
+
+import main
+
+
+def _serve(monkeypatch, body: bytes, content_type: str) -> None:
+    """Point the shared HTTP client at a canned response."""
+    def handler(request):
+        return httpx.Response(200, content=body, headers={'content-type': content_type})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(main.app.state, 'http_client', client, raising=False)
+
+
+def test_extract_webpage_uses_header_charset(monkeypatch):
+    # No <meta charset>: only the Content-Type header says UTF-8
+    page = '<html><head><title>café</title></head><body><p>2019–2024</p></body></html>'
+    _serve(monkeypatch, page.encode('utf-8'), 'text/html; charset=utf-8')
+
+    result = asyncio.run(main.extract_webpage('https://example.com/'))
+
+    assert result['success']
+    assert result['title'] == 'café'
+    assert '2019–2024' in result['full_text']
+
+
+def test_extract_webpage_survives_unknown_header_charset(monkeypatch):
+    page = '<html><head><meta charset="utf-8"><title>café</title></head><body><p>ok</p></body></html>'
+    _serve(monkeypatch, page.encode('utf-8'), 'text/html; charset=foo-bar')
+
+    result = asyncio.run(main.extract_webpage('https://example.com/'))
+
+    # Falls back to lxml's own detection, which finds the <meta charset>
+    assert result['success']
+    assert result['title'] == 'café'
+
+
+def test_extract_webpage_accepts_python_charset_aliases(monkeypatch):
+    # libxml2 doesn't know 'latin-1', only its canonical name
+    _serve(monkeypatch, '<title>café</title>'.encode('latin-1'), 'text/html; charset=latin-1')
+
+    result = asyncio.run(main.extract_webpage('https://example.com/'))
+
+    assert result['success']
+    assert result['title'] == 'café'
+
+
+def test_extract_webpage_accepts_any_media_type_case(monkeypatch):
+    _serve(monkeypatch, b'<title>Loud</title><p>Shouty headers.</p>', 'Text/HTML; Charset=UTF-8')
+
+    result = asyncio.run(main.extract_webpage('https://example.com/'))
+
+    assert result['success']
+    assert result['title'] == 'Loud'
+
+
+def test_failed_extraction_skips_synthesis(monkeypatch):
+    _serve(monkeypatch, b'%PDF-1.7', 'application/pdf')
+
+    async def fail_run(**kwargs):
+        raise AssertionError("synthesis should not run")
+
+    monkeypatch.setattr(main.Runner, 'run', fail_run)
+
+    extraction, analysis, cached = asyncio.run(main._run_pipeline('https://arxiv.org/pdf/2401.00001'))
+
+    assert not extraction['success']
+    assert 'application/pdf' in extraction['error']
+    assert analysis is None
+    assert not cached
+
+
+def test_semantic_cache_does_not_reuse_pages_that_share_boilerplate(monkeypatch):
+    chrome = 'Main menu Navigation Contents Current events Random article ' * 20
+    pages = {
+        '/wiki/Event_loop': f'<title>Event loop</title><body><nav>{chrome}</nav><p>An event loop waits for events.</p></body>',
+        '/wiki/Coroutine': f'<title>Coroutine</title><body><nav>{chrome}</nav><p>Coroutines suspend and resume.</p></body>',
+    }
+
+    def handler(request):
+        return httpx.Response(200, content=pages[request.url.path].encode(), headers={'content-type': 'text/html'})
+
+    monkeypatch.setattr(main.app.state, 'http_client', httpx.AsyncClient(transport=httpx.MockTransport(handler)), raising=False)
+    monkeypatch.setattr(main, '_semantic_vectors', main.np.zeros_like(main._semantic_vectors))
+    monkeypatch.setattr(main, '_semantic_entries', [None] * main.SEMANTIC_MAX_ENTRIES)
+    monkeypatch.setattr(main, '_semantic_count', 0)
+    monkeypatch.setattr(main, '_semantic_next', 0)
+
+    embedded = []
+
+    async def fake_embed(text):
+        # Worst case: the shared chrome makes both pages embed identically
+        embedded.append(text)
+        vector = main.np.ones(main.SEMANTIC_EMBEDDING_DIMS, dtype=main.np.float32)
+        return vector / main.np.linalg.norm(vector)
+
+    checks = []
+
+    async def fake_run(starting_agent, input, **kwargs):
+        class Result:
+            pass
+        result = Result()
+        if starting_agent is main.duplicate_checker_agent:
+            checks.append(input)
+            result.final_output = main.DuplicateVerdict(same_content=False)
+        else:
+            summary = 'coroutines' if 'Coroutines suspend' in input else 'event loop'
+            result.final_output = main.Analysis(key_points=[], concepts=[], summary=summary)
+        return result
+
+    monkeypatch.setattr(main, '_embed', fake_embed)
+    monkeypatch.setattr(main.Runner, 'run', fake_run)
+
+    async def ingest_both():
+        first = await main._run_pipeline('https://en.wikipedia.org/wiki/Event_loop')
+        second = await main._run_pipeline('https://en.wikipedia.org/wiki/Coroutine')
+        return first, second
+
+    (_, first, _), (_, second, cached) = asyncio.run(ingest_both())
+
+    assert first['summary'] == 'event loop'
+    assert second['summary'] == 'coroutines'
+    assert not cached
+    # The body, not just the leading chrome, is embedded and checked
+    assert 'Coroutines suspend and resume.' in embedded[1]
+    assert len(checks) == 1
+
+
+def test_concurrent_streams_for_one_url_share_a_run(monkeypatch):
+    fetches = []
+
+    def handler(request):
+        fetches.append(request.url)
+        return httpx.Response(200, content=b'<title>Event loop</title><p>An event loop waits.</p>', headers={'content-type': 'text/html'})
+
+    monkeypatch.setattr(main.app.state, 'http_client', httpx.AsyncClient(transport=httpx.MockTransport(handler)), raising=False)
+    monkeypatch.setattr(main, '_ingest_cache', {})
+
+    async def no_embed(text):
+        raise RuntimeError("no embeddings in tests")
+
+    class FakeStream:
+        is_complete = False
+
+        def __init__(self):
+            self.final_output = main.Analysis(key_points=[], concepts=[], summary='event loop')
+
+        async def stream_events(self):
+            await asyncio.sleep(0.01)
+            self.is_complete = True
+            return
+            yield
+
+    monkeypatch.setattr(main, '_embed', no_embed)
+    monkeypatch.setattr(main.Runner, 'run_streamed', lambda **kwargs: FakeStream())
+
+    async def consume():
+        events = [chunk async for chunk in main._stream_ingest(main.Visit(url='https://example.com/loop'))]
+        return events[-1]
+
+    async def both():
+        return await asyncio.gather(consume(), consume())
+
+    first, second = asyncio.run(both())
+
+    assert len(fetches) == 1
+    # The waiter gets the owner's result as is
+    assert '"cached":false' in first
+    assert second == first
+    assert not main._ingest_inflight
+
+
+def test_duplicate_requests_share_a_failing_run(monkeypatch):
+    runs = []
+
+    async def failing_pipeline(url):
+        runs.append(url)
+        await asyncio.sleep(0.05)
+        return {'success': False, 'error': 'timed out'}, None, False
+
+    monkeypatch.setattr(main, '_ingest_cache', {})
+    monkeypatch.setattr(main, '_run_pipeline', failing_pipeline)
+
+    async def raising_pipeline(url):
+        runs.append(url)
+        await asyncio.sleep(0.05)
+        raise RuntimeError("synthesis down")
+
+    async def duplicates():
+        failed = await asyncio.gather(*(main._run_pipeline_cached('https://example.com/dead') for _ in range(4)))
+        monkeypatch.setattr(main, '_run_pipeline', raising_pipeline)
+        raised = await asyncio.gather(
+            *(main._run_pipeline_cached('https://example.com/dead') for _ in range(4)),
+            return_exceptions=True,
+        )
+        return failed, raised
+
+    failed, raised = asyncio.run(duplicates())
+
+    assert len(runs) == 2
+    assert all(result == failed[0] for result in failed)
+    assert all(isinstance(e, RuntimeError) for e in raised)
+    assert not main._ingest_inflight
+
+
+def test_stream_disconnect_cancels_synthesis(monkeypatch):
+    _serve(monkeypatch, b'<title>Event loop</title><p>An event loop waits.</p>', 'text/html')
+    monkeypatch.setattr(main, '_ingest_cache', {})
+
+    async def no_embed(text):
+        raise RuntimeError("no embeddings in tests")
+
+    class FakeStream:
+        is_complete = False
+        cancelled = False
+
+        async def stream_events(self):
+            while True:
+                yield type('Event', (), {'type': 'raw_response_event', 'data': main.ResponseTextDeltaEvent.model_construct(delta='x')})()
+
+        def cancel(self):
+            self.cancelled = True
+
+    stream = FakeStream()
+    monkeypatch.setattr(main, '_embed', no_embed)
+    monkeypatch.setattr(main.Runner, 'run_streamed', lambda **kwargs: stream)
+
+    async def disconnect_after_first_delta():
+        events = main._stream_ingest(main.Visit(url='https://example.com/loop'))
+        async for chunk in events:
+            if chunk.startswith('event: analysis_delta'):
+                break
+        await events.aclose()
+
+    asyncio.run(disconnect_after_first_delta())
+
+    assert stream.cancelled
+    assert not main._ingest_inflight
+
+
+def test_ingest_response_shape(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    with TestClient(main.app) as client:
+        ok = client.post('/ingest', json={'url': 'ftp://example.com/file'}).json()
+
+        async def broken(url, use_cache=True):
+            raise RuntimeError("boom")
+
+        monkeypatch.setattr(main, '_run_pipeline_cached', broken)
+        failed = client.post('/ingest', json={'url': 'https://example.com/', 'tab_id': 3}).json()
+
+    assert ok['analysis'] is None
+    assert ok['tab_id'] is None
+    assert ok['extraction'] == {'success': False, 'error': 'unsupported URL scheme: ftp'}
+    assert set(failed) == {'accepted', 'url', 'tab_id', 'timestamp', 'error'}
+    assert failed['error'] == 'processing_error: boom'
+
+
+def test_bypass_cache_runs_every_request(monkeypatch):
+    runs = []
+
+    async def pipeline(url, use_cache=True):
+        runs.append(use_cache)
+        return {'success': True, 'url': url, 'title': 't', 'full_text': 'x'}, {'key_points': [], 'concepts': [], 'summary': 's'}, False
+
+    monkeypatch.setattr(main, '_ingest_cache', {})
+    monkeypatch.setattr(main, '_run_pipeline', pipeline)
+
+    async def twice():
+        return await asyncio.gather(*(main._run_pipeline_cached('https://example.com/', use_cache=False) for _ in range(2)))
+
+    results = asyncio.run(twice())
+
+    assert runs == [False, False]
+    assert not any(cached for _, _, cached in results)
+    assert not main._ingest_cache
+
+
+def test_pick_synthesis_agent():
+    long_transcript = {'success': True, 'video_id': 'dQw4w9WgXcQ', 'full_text': 'x' * main.FULL_TEXT_LIMIT}
+    page = {'success': True, 'full_text': 'x' * 100}
+
+    assert main.pick_synthesis_agent('https://arxiv.org/abs/2401.00001', page) is main.synthesis_agent_large
+    assert main.pick_synthesis_agent('https://www.cs.stanford.edu/notes', page) is main.synthesis_agent_large
+    assert main.pick_synthesis_agent('https://export.arxiv.org/abs/2401.00001', page) is main.synthesis_agent_large
+    # Lookalike hosts don't count as academic
+    assert main.pick_synthesis_agent('https://notarxiv.org/post', page) is main.synthesis_agent
+    assert main.pick_synthesis_agent('https://blog.example.com/post', page) is main.synthesis_agent
+    # Transcripts are truncated like any page, so a long one stays on the small model
+    assert main.pick_synthesis_agent('https://www.youtube.com/watch?v=dQw4w9WgXcQ', long_transcript) is main.synthesis_agent